@@ -5,6 +5,9 @@ Defines a custom logger with split coloring:
 - The metadata part (timestamp and level) is colorized based on log severity.
 - The actual log message is always white for better readability.
 
+Colors are only used when stderr is a terminal; when logs are piped or captured
+(cron, Kubernetes, files), a plain formatter with the same layout is used instead.
+
 Available log levels:
 - DEBUG (blue)
 - INFO (green)
@@ -20,6 +23,7 @@ Usage:
 """
 
 import logging
+import sys
 
 class ColorFormatter(logging.Formatter):
     """
@@ -30,6 +34,7 @@ class ColorFormatter(logging.Formatter):
         COLORS (dict): Mapping of log levels to ANSI color codes.
         RESET (str): ANSI code to reset color to default after each message.
         WHITE (str): ANSI code for standard white color.
+        TEMPLATE (str): Layout of a log line, rendered once per level at init.
     """
     COLORS = {
         logging.DEBUG: "\033[94m",     # Blue
@@ -40,24 +45,45 @@ class ColorFormatter(logging.Formatter):
     }
     RESET = "\033[0m"
     WHITE = "\033[97m"
+    TEMPLATE = "{color}%(asctime)s - [%(levelname)s]{reset} - {white}%(message)s{reset}"
+
+    def __init__(self, *args, **kwargs) -> None:
+        """
+        Initialize the formatter and pre-render one %-style template per log
+        level, so only the timestamp and message are filled in per record.
+        """
+        super().__init__(*args, **kwargs)
+        self._templates = {
+            level: self.TEMPLATE.format(color=color, reset=self.RESET, white=self.WHITE)
+            for level, color in self.COLORS.items()
+        }
+        self._default_template = self.TEMPLATE.format(
+            color=self.RESET, reset=self.RESET, white=self.WHITE
+        )
+
+    def usesTime(self) -> bool:
+        """
+        Always compute ``asctime``, since every template includes it.
+
+        Returns:
+            bool: Always True.
+        """
+        return True
 
-    def format(self, record: logging.LogRecord) -> str:
+    def formatMessage(self, record: logging.LogRecord) -> str:
         """
-        Format the given log record, applying color to metadata and keeping
-        the message part in white.
+        Render the record with the template for its level, applying color to
+        metadata and keeping the message part in white.
 
         Args:
-            record (logging.LogRecord): The log record to format.
+            record (logging.LogRecord): The log record to format, with
+                ``asctime`` and ``message`` already set by ``format``.
 
         Returns:
-            str: The formatted and colorized log message.
+            str: The colorized log line.
         """
-        # generate timestamp manually
-        asctime = self.formatTime(record, self.datefmt)
-        color = self.COLORS.get(record.levelno, self.RESET)
-        meta = f"{asctime} - [{record.levelname}]"
-        message = record.getMessage()
-        return f"{color}{meta}{self.RESET} - {self.WHITE}{message}{self.RESET}"
+        template = self._templates.get(record.levelno, self._default_template)
+        return template % record.__dict__
 
 
 # --- Logger Setup ---
@@ -69,11 +95,14 @@ logger.setLevel(logging.INFO)
 # Create a console handler
 handler = logging.StreamHandler()
 
-# Create and apply the custom color formatter
-formatter = ColorFormatter(
-    fmt="%(asctime)s - %(levelname)s - %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S"
-)
+# Create and apply the custom color formatter, or a plain one when not on a terminal
+LOG_FORMAT = "%(asctime)s - [%(levelname)s] - %(message)s"
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+formatter: logging.Formatter
+if sys.stderr.isatty():
+    formatter = ColorFormatter(fmt=LOG_FORMAT, datefmt=DATE_FORMAT)
+else:
+    formatter = logging.Formatter(fmt=LOG_FORMAT, datefmt=DATE_FORMAT)
 handler.setFormatter(formatter)
 
 # Add the handler to the logger
@@ -6,14 +6,25 @@ from the Renault Retail Group API, and upserts each individual car record
 into MongoDB.
 """
 
+import logging
+import math
 import os
-from typing import Dict, List, Optional
-from urllib.parse import urljoin
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from itertools import islice
+from typing import Any, Deque, Dict, Iterator, List, Tuple
+from urllib.parse import parse_qs, urlsplit
 
-import requests
+import httpx
+import orjson
 from dotenv import load_dotenv
+from pydantic import TypeAdapter
 from pymongo import UpdateOne
 from pymongo.mongo_client import MongoClient as PyMongoClient
+from pymongo.write_concern import WriteConcern
 
 from models import CarStockItem
 from logger import logger
@@ -23,6 +34,50 @@ load_dotenv()
 MONGO_URI = os.getenv("MONGO_URI")
 
 RRG_API_URL = "https://api.retail-renault-group.fr/car_stocks"
+ITEMS_PER_PAGE = 500
+FETCH_WORKERS = 8
+# Number of upserts sent per bulk_write call
+BULK_BATCH_SIZE = 1000
+# Transient gateway errors retried by _fetch_page (along with transport errors such as
+# read timeouts or dropped connections), with exponential backoff
+RETRY_STATUSES = frozenset({502, 503, 504})
+MAX_RETRIES = 3
+RETRY_BACKOFF = 0.3
+
+# Validates a whole page of members in a single pydantic-core call
+_ITEMS_ADAPTER = TypeAdapter(List[CarStockItem])
+# Fields validated and persisted, in model order; everything else in the raw API
+# payload is dropped
+_FIELDS = tuple(CarStockItem.model_fields)
+
+# Shared HTTP/2 client: concurrent page fetches are multiplexed over one TLS connection
+# (httpx falls back to HTTP/1.1 keep-alive if the server does not negotiate h2)
+_CLIENT = httpx.Client(
+    transport=httpx.HTTPTransport(
+        http2=True,
+        limits=httpx.Limits(max_keepalive_connections=4, max_connections=FETCH_WORKERS),
+    ),
+    # Pages compress very well; only advertise codecs httpx can always decode
+    headers={"Accept-Encoding": "gzip, deflate"},
+    timeout=30.0,
+)
+# httpx logs every request at INFO; page fetches and retries are already logged here
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+
+@dataclass
+class CrawlStats:
+    """
+    Progress of a crawl, filled in by ``iter_rrg_pages`` as pages are consumed.
+
+    Attributes:
+        total_items: ``hydra:totalItems`` announced by the API on page 1.
+        pages: Number of pages the crawl spans.
+        fetched: Number of vehicles actually received so far.
+    """
+    total_items: int = 0
+    pages: int = 0
+    fetched: int = 0
 
 
 def connect_to_mongo() -> PyMongoClient:
@@ -42,42 +97,169 @@ def connect_to_mongo() -> PyMongoClient:
     return client
 
 
-def fetch_rrg_stocks() -> List[CarStockItem]:
+def _fetch_page(page: int) -> Dict[str, Any]:
     """
-    Fetch and parse **all pages** of vehicle stock data from the RRG API.
+    Fetch a single page of vehicle stock data from the RRG API.
+
+    Transport errors (connect/read timeouts, dropped connections, protocol
+    errors) and responses with a status in RETRY_STATUSES are retried up to
+    MAX_RETRIES times with exponential backoff; each retry is logged.
 
-    Follows pagination and returns a flat list of CarStockItem objects.
+    Args:
+        page (int): 1-based page number to fetch.
+
+    Raises:
+        httpx.TransportError: If the request still fails after MAX_RETRIES retries.
+        httpx.HTTPStatusError: If the API answers with an error status.
 
     Returns:
-        List[CarStockItem]: List of all fetched car stock items.
+        Dict[str, Any]: Decoded JSON-LD body of the page.
     """
-    all_items: List[CarStockItem] = []
-    next_url: Optional[str] = RRG_API_URL
-    page: int = 1
-    params: Optional[Dict[str, int]] = {"itemsPerPage": 500, "page": page}
-
-    while next_url:
-        logger.info("📦 Fetching page %d from %s", page, next_url)
-        resp = requests.get(next_url, params=params, timeout=30)
-        resp.raise_for_status()
-        data = resp.json()
-
-        members = data.get("hydra:member", [])
-        logger.info("↳ Retrieved %d items on page %d", len(members), page)
-        all_items.extend(CarStockItem(**raw) for raw in members)
-
-        # Prepare next iteration
-        view = data.get("hydra:view", {})
-        next_link = view.get("hydra:next")
-        if next_link:
-            next_url = urljoin(RRG_API_URL, next_link)
-            page += 1
-            params = None  # subsequent calls embed page in next_url
+    logger.info("📦 Fetching page %d from %s", page, RRG_API_URL)
+    params = {"itemsPerPage": ITEMS_PER_PAGE, "page": page}
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            resp = _CLIENT.get(RRG_API_URL, params=params)
+        except httpx.TransportError as exc:
+            if attempt == MAX_RETRIES:
+                raise
+            reason = f"{type(exc).__name__}: {exc}"
         else:
-            next_url = None
+            if resp.status_code not in RETRY_STATUSES or attempt == MAX_RETRIES:
+                break
+            reason = f"HTTP {resp.status_code}"
+        delay = RETRY_BACKOFF * 2**attempt
+        logger.warning(
+            "⚠️ Page %d failed (%s), retrying in %.1fs (%d/%d)",
+            page,
+            reason,
+            delay,
+            attempt + 1,
+            MAX_RETRIES,
+        )
+        time.sleep(delay)
+    resp.raise_for_status()
+    if page == 1:
+        # Surface transport regressions (lost compression or h2) in the job logs
+        logger.info(
+            "↳ Served over %s with content-encoding=%s",
+            resp.http_version,
+            resp.headers.get("content-encoding", "identity"),
+        )
+    return orjson.loads(resp.content)
 
-    logger.info("✅ Completed fetching %d vehicles across %d pages", len(all_items), page)
-    return all_items
+
+def _validate_page(members: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Trim a page's raw members to the CarStockItem fields and validate them.
+
+    Extra API fields (images, diacOffers, ...) are dropped before the dicts
+    reach pydantic-core, which keeps validation short. The result is each
+    validated item's ``__dict__``: a plain attribute read, not a ``model_dump``
+    serialization pass, that still carries Pydantic's coerced values (e.g. a
+    price of 15990 becomes 15990.0) so MongoDB stores the declared types.
+
+    Args:
+        members (List[Dict[str, Any]]): Raw ``hydra:member`` dicts of a page.
+
+    Raises:
+        pydantic.ValidationError: If any member does not match CarStockItem.
+
+    Returns:
+        List[Dict[str, Any]]: The validated field values of each member, ready to be persisted.
+    """
+    # Iterate in model order so documents always get the same field order
+    trimmed = [{k: raw[k] for k in _FIELDS if k in raw} for raw in members]
+    return [item.__dict__ for item in _ITEMS_ADAPTER.validate_python(trimmed)]
+
+
+def _page_count(data: Dict[str, Any]) -> int:
+    """
+    Work out how many pages the crawl spans from the first page's body.
+
+    ``hydra:view["hydra:last"]`` is authoritative when present. Otherwise the
+    count is derived from ``hydra:totalItems`` and the number of members the
+    server actually returned, since it may clamp ``itemsPerPage`` below
+    ITEMS_PER_PAGE.
+
+    Args:
+        data (Dict[str, Any]): Decoded body of page 1.
+
+    Raises:
+        KeyError: If the body has no ``hydra:totalItems``.
+
+    Returns:
+        int: Total number of pages, at least 1.
+    """
+    total_items: int = data["hydra:totalItems"]
+    last_link = data.get("hydra:view", {}).get("hydra:last")
+    if last_link:
+        last_page = parse_qs(urlsplit(last_link).query).get("page")
+        if last_page:
+            return max(1, int(last_page[0]))
+
+    page_size = len(data.get("hydra:member", []))
+    if not page_size:
+        return 1
+    return max(1, math.ceil(total_items / page_size))
+
+
+def iter_rrg_pages(stats: CrawlStats) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Fetch and parse **all pages** of vehicle stock data from the RRG API.
+
+    The page count is derived from the first page (see ``_page_count``); the
+    remaining pages are then fetched concurrently and yielded in
+    page order as soon as each one is validated, so callers can process a page
+    while the next ones are still in flight. At most ``FETCH_WORKERS`` pages are
+    buffered at any time, which bounds peak memory regardless of stock size.
+
+    Every page is trimmed to the CarStockItem fields and validated so malformed
+    payloads fail the run; callers get the validated values as plain dicts and
+    never pay for serializing the models back.
+
+    Args:
+        stats (CrawlStats): Updated in place with the announced total and the
+            number of vehicles fetched, so callers can tell a complete crawl
+            from a short one once the generator is exhausted.
+
+    Yields:
+        List[Dict[str, Any]]: Validated field values of each member of a page.
+    """
+    data = _fetch_page(1)
+    stats.total_items = data["hydra:totalItems"]
+    stats.pages = pages = _page_count(data)
+
+    members = data.get("hydra:member", [])
+    logger.info("↳ Retrieved %d items on page 1 (%d pages expected)", len(members), pages)
+    stats.fetched = len(members)
+    yield _validate_page(members)
+
+    with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as pool:
+        # Keep at most FETCH_WORKERS pages in flight (unlike pool.map, which submits them
+        # all), so decoded bodies never pile up while the caller is busy writing
+        remaining = iter(range(2, pages + 1))
+        in_flight: Deque[Tuple[int, Future]] = deque(
+            (page, pool.submit(_fetch_page, page)) for page in islice(remaining, FETCH_WORKERS)
+        )
+        while in_flight:
+            page, future = in_flight.popleft()
+            data = future.result()
+            next_page = next(remaining, None)
+            if next_page is not None:
+                in_flight.append((next_page, pool.submit(_fetch_page, next_page)))
+
+            members = data.get("hydra:member", [])
+            logger.info("↳ Retrieved %d items on page %d", len(members), page)
+            stats.fetched += len(members)
+            yield _validate_page(members)
+
+    logger.info(
+        "✅ Completed fetching %d/%d vehicles across %d pages",
+        stats.fetched,
+        stats.total_items,
+        pages,
+    )
 
 
 def main() -> None:
@@ -86,43 +268,70 @@ def main() -> None:
 
     1. Connects to MongoDB.
     2. Fetches **all** vehicle stock data (all pages).
-    3. Bulk-upserts each CarStockItem into "vehicle_stocks".
-    4. Deletes entries that no longer exist.
-    5. Closes the MongoDB connection.
+    3. Bulk-upserts each page of vehicles into "vehicle_stocks" as it arrives.
+    4. Deletes entries that no longer exist, if every announced vehicle was fetched.
+    5. Closes the MongoDB and HTTP connections.
     """
     logger.info("🚀 Starting scheduler")
     client = connect_to_mongo()
     db = client["waib_rrg_db"]
-    stocks = db["vehicle_stocks"]
-
-    # 1) fetch & parse all pages
-    stock_items = fetch_rrg_stocks()
-    current_ids = {item.id for item in stock_items}
-
-    # 2) upsert vehicles in bulk
-    ops = [
-        UpdateOne({"id": item.id}, {"$set": item.model_dump()}, upsert=True) for item in stock_items
-    ]
-    if ops:
-        result = stocks.bulk_write(ops)
-        logger.info(
-            "Upserted %d records (inserts=%d / updates=%d)",
-            result.upserted_count + result.modified_count,
-            result.upserted_count,
-            result.modified_count,
+    # The crawl is idempotent (the next run re-upserts anything lost), so only wait for
+    # the primary's in-memory ack instead of journal sync / replica acknowledgement
+    stocks = db.get_collection("vehicle_stocks", write_concern=WriteConcern(w=1, j=False))
+    # Idempotent: upserts match on "id" and the stale-record sweep filters on "fetchedAt"
+    stocks.create_index("id", unique=True)
+    stocks.create_index("fetchedAt")
+
+    # Every upserted record is stamped with this run's timestamp
+    run_ts = datetime.now(timezone.utc)
+
+    # 1) fetch & upsert page by page, straight from the validated API dicts
+    stats = CrawlStats()
+    pending: List[UpdateOne] = []
+    upserted = modified = 0
+    for members in iter_rrg_pages(stats):
+        pending.extend(
+            UpdateOne({"id": doc["id"]}, {"$set": {**doc, "fetchedAt": run_ts}}, upsert=True)
+            for doc in members
         )
+        # upserts are keyed by id and independent, so they can be applied unordered
+        while len(pending) >= BULK_BATCH_SIZE:
+            result = stocks.bulk_write(pending[:BULK_BATCH_SIZE], ordered=False)
+            upserted += result.upserted_count
+            modified += result.modified_count
+            del pending[:BULK_BATCH_SIZE]
+
+    if pending:
+        result = stocks.bulk_write(pending, ordered=False)
+        upserted += result.upserted_count
+        modified += result.modified_count
 
-    # 3) delete vehicles that no longer exist
-    existing_ids = set(doc["id"] for doc in stocks.find({}, {"id": 1}))
-    to_delete_ids = list(existing_ids - current_ids)
+    logger.info(
+        "Upserted %d records (inserts=%d / updates=%d)",
+        upserted + modified,
+        upserted,
+        modified,
+    )
 
-    if to_delete_ids:
-        delete_result = stocks.delete_many({"id": {"$in": to_delete_ids}})
-        logger.info("Deleted %d stale records", delete_result.deleted_count)
+    # 2) delete vehicles that were not part of this run (or predate fetchedAt stamping),
+    # but only after a complete crawl: a short one would wipe every vehicle it missed
+    if stats.fetched < stats.total_items:
+        logger.warning(
+            "⚠️ Fetched only %d of %d announced vehicles, skipping stale record deletion",
+            stats.fetched,
+            stats.total_items,
+        )
     else:
-        logger.info("🧼 No stale records to delete")
+        delete_result = stocks.delete_many(
+            {"$or": [{"fetchedAt": {"$lt": run_ts}}, {"fetchedAt": None}]}
+        )
+        if delete_result.deleted_count:
+            logger.info("Deleted %d stale records", delete_result.deleted_count)
+        else:
+            logger.info("🧼 No stale records to delete")
 
     client.close()
+    _CLIENT.close()
     logger.info("🏁 Scheduler run complete")
 
 
@@ -6,7 +6,7 @@ Defines schemas for individual car stock items, aggregation buckets, and overall
 """
 
 from typing import Dict, List, Optional, Union
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 
 
 class KeyCount(BaseModel):
@@ -73,6 +73,8 @@ class CarStockItem(BaseModel):
 
     Only key fields are included; lengthy arrays (images, diacOffers, etc.) are omitted.
     """
+    model_config = ConfigDict(extra="ignore", frozen=True)
+
     id: int
     name: str
     brand: str